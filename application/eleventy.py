@@ -8,9 +8,8 @@ import typing
 
 import boto3
 from flask import Flask, request, Response, render_template
-from slugify import slugify
 
-from application.utils import random_string
+from application.utils import fast_slugify, random_string
 
 
 class LambdaMessageEncoder(json.JSONEncoder):
@@ -90,7 +89,7 @@ class Flask11tyServerless:
     def create_route(self, uri, target):
         """Create a single route within the Flask app"""
 
-        route_id = f'routes-{slugify(uri)}'
+        route_id = f'routes-{fast_slugify(uri)}'
         if route_id in self._data:
             route_id = f'{route_id}-{random_string(10)}'
         self._data.update({route_id: target})
@@ -14,7 +14,6 @@ from flask import Flask, abort, request, redirect, Response, jsonify
 from flask_cors import CORS
 from flask_cors.core import probably_regex, try_match_any
 from flask_csp import CSP
-from slugify import slugify
 from sentry_sdk.integrations.flask import FlaskIntegration
 
 from application import stripe
@@ -24,7 +23,7 @@ from application.authorizer import FlaskJSONAuthorizer
 from application.redirects import FlaskJSONRedirects
 from application.s3proxy import FlaskS3Proxy
 from application.geography import FlaskGeography
-from application.utils import forced_host_redirect, init_extension
+from application.utils import HAS_ORJSON, OrjsonProvider, forced_host_redirect, init_extensions
 
 
 def origins_list_to_regex(app, origins):
@@ -76,6 +75,8 @@ def create_app(name, log_level=logging.WARN):
 def _create_app(name, log_level=logging.WARN):
     app = Flask(name, static_folder=None)
     app.url_map.strict_slashes = False
+    if HAS_ORJSON:
+        app.json = OrjsonProvider(app)
 
     FlaskDynaconf(app)
 
@@ -106,9 +107,11 @@ def _create_app(name, log_level=logging.WARN):
     app.s3_proxy = FlaskS3Proxy(app)
     app.geography = FlaskGeography(app)
 
-    app.authorizer = init_extension(app, FlaskJSONAuthorizer, 'S3_AUTHORIZER_FILE')
-    app.eleventy = init_extension(app, Flask11tyServerless, 'S3_ELEVENTY_FILE')
-    app.redirects = init_extension(app, FlaskJSONRedirects, 'S3_REDIRECTS_FILE')
+    app.authorizer, app.eleventy, app.redirects = init_extensions(app, [
+        (FlaskJSONAuthorizer, 'S3_AUTHORIZER_FILE'),
+        (Flask11tyServerless, 'S3_ELEVENTY_FILE'),
+        (FlaskJSONRedirects, 'S3_REDIRECTS_FILE'),
+    ])
 
     # Due to the redirects possibly using these routes, we are adding these after having
     # instantiated all the redirects. If not for that, we could have used a config value
@@ -144,7 +147,7 @@ def _create_app(name, log_level=logging.WARN):
                     not try_match_any(origin, app.allowed_origins) and
                     not try_match_any(f'{origin}/', app.allowed_origins)
             ):
-                app.logger.debug('Origin header not in allowed list: {}'.format(origin))
+                app.logger.debug(f'Origin header not in allowed list: {origin}')
                 return False
 
         return True
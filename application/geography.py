@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import json
 import typing
 from urllib.parse import unquote
@@ -8,6 +9,7 @@ import botocore
 from flask import (
     Blueprint,
     Flask,
+    Response,
     abort,
     current_app,
     jsonify,
@@ -42,6 +44,13 @@ AS_FLOAT = [
     'cloudfront-viewer-longitude',
 ]
 
+# The WSGI environ keys of the desired headers, so they can be read straight from the environ
+# instead of going through werkzeug's header normalization for every header of the request.
+ENVIRON_HEADERS = tuple(
+    (f"HTTP_{header.upper().replace('-', '_')}", key, header in AS_FLOAT)
+    for header, key in DESIRED_HEADERS.items()
+)
+
 REGION_UNIT = {
     'US': Unit.MILES,
     'UK': Unit.MILES,
@@ -60,6 +69,10 @@ POINT_NEMO_HEADERS = {
     'timezone': 'Etc/GMT-9',
 }
 
+# How long browsers may reuse a geography response. It is derived from the viewer's IP address,
+# so it must never be cached by a shared cache.
+GEOGRAPHY_MAX_AGE = 60
+
 TESTING_HEADERS = {
     "city": "Saint-Eugene",
     "country_code": "CA",
@@ -73,6 +86,29 @@ TESTING_HEADERS = {
 }
 
 
+def parse_cf_headers(environ: typing.Mapping[str, str]) -> typing.Dict[str, typing.Any]:
+    """Extract the CloudFront geolocation values from a WSGI environ"""
+
+    cf_headers = {}
+    for environ_key, key, as_float in ENVIRON_HEADERS:
+        value = environ.get(environ_key)
+        if value is None:
+            continue
+
+        try:
+            value = unquote(value)
+
+        except TypeError as exc:
+            current_app.logger.exception(exc)
+
+        if as_float:
+            value = float(value)
+
+        cf_headers[key] = value
+
+    return cf_headers
+
+
 class FlaskGeography:
 
     _use_country_code_comparison: bool = None
@@ -183,22 +219,7 @@ class FlaskGeographyResponse:
     country_code_comparison = None
 
     def __init__(self, *, country_code_comparison=True):
-        self.cf_headers = {}
-
-        for header, value in request.headers:
-            if header.lower() in DESIRED_HEADERS:
-                try:
-                    value = unquote(value)
-
-                except TypeError as exc:
-                    self.app.logger.exception(exc)
-
-                if header.lower() in AS_FLOAT:
-                    value = float(value)
-
-                self.cf_headers.update({
-                    DESIRED_HEADERS[header.lower()]: value
-                })
+        self.cf_headers = parse_cf_headers(request.environ)
 
         if not self.cf_headers:
             # When we're not running behind CloudFront, we want valid data,
@@ -212,7 +233,20 @@ class FlaskGeographyResponse:
         self.country_code_comparison = bool(country_code_comparison)
 
     def basic(self):
-        return jsonify(self.cf_headers)
+        etag = hashlib.blake2b(
+            json.dumps(self.cf_headers, sort_keys=True).encode('utf-8'),
+            digest_size=8,
+        ).hexdigest()
+
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(self.cf_headers)
+
+        response.set_etag(etag, weak=True)
+        response.cache_control.private = True
+        response.cache_control.max_age = GEOGRAPHY_MAX_AGE
+        return response
 
     def closest_to_user(self, data):
         """
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache whose entries expire `ttl` seconds after being stored, and whose
+    total size, as given by the caller for each entry, is kept under `max_size`.
+    """
+
+    def __init__(self, *, ttl=60, max_size=16 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            expires, _, value = entry
+            if expires <= time.monotonic():
+                self._remove(key)
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def get_entry(self, key):
+        """
+        Return a (value, fresh) tuple for a key. Unlike get(), expired entries are returned too, so
+        that they can be revalidated. (None, False) is returned for unknown keys.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+
+            expires, _, value = entry
+            self._entries.move_to_end(key)
+            return value, expires > time.monotonic()
+
+    def refresh(self, key):
+        """Restart the TTL of an entry, once it has been revalidated"""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                _, size, value = entry
+                self._entries[key] = (time.monotonic() + self.ttl, size, value)
+                self._entries.move_to_end(key)
+
+    def set(self, key, value, *, size=0):
+        """Store a value, returning False if it could not be cached"""
+
+        if not self.enabled or size > self.max_size:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.size += size
+
+            # Evict the least recently used entries until we're back within budget
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+
+class SingleFlight:
+    """
+    Lets a single thread at a time do the work for a key, e.g. fetching it, while the other threads
+    wanting it wait for that work to be done rather than repeat it concurrently.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """
+        Return True if the caller is to do the work for the key, and must then call end(). Otherwise,
+        wait until the thread doing it is done and return False.
+        """
+
+        with self._lock:
+            done = self._flights.get(key)
+            if done is None:
+                self._flights[key] = threading.Event()
+                return True
+
+        done.wait()
+        return False
+
+    def end(self, key):
+        with self._lock:
+            done = self._flights.pop(key)
+        done.set()
@@ -1,9 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import enum
 import json
-import pytz
 from pip._vendor.distlib.version import Version
 import uuid
 
@@ -12,7 +11,7 @@ class ExtendedEncoder(json.JSONEncoder):
 
     def default(self, obj):
         if isinstance(obj, datetime):
-            return obj.replace(tzinfo=pytz.UTC).isoformat('T')
+            return obj.replace(tzinfo=timezone.utc).isoformat('T')
         if isinstance(obj, timedelta):
             return str(obj)
         if isinstance(obj, Version):
@@ -1,26 +1,83 @@
 
+import codecs
 import io
 import json
 import typing
 
-from flask import Flask, redirect
+from flask import Flask, Response, redirect
 from sentry_sdk import capture_exception
-from slugify import slugify
 
-from application.utils import random_string, forced_host_redirect, str2bool
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+from application.utils import fast_slugify, forced_host_redirect, str2bool
+
+
+ABSOLUTE_URL_PREFIXES = ('http:', 'https:')
+
+JSON_ERRORS = (json.JSONDecodeError, ijson.JSONError) if HAS_IJSON else (json.JSONDecodeError,)
+
+
+class _RedirectView:
+    """The view function of a single redirect, holding its target and status code"""
+
+    __slots__ = ('target', 'status_code', 'needs_format', 'is_absolute')
+
+    def __init__(self, target: str, status_code: int):
+        self.target = target
+        self.status_code = status_code
+        self.needs_format = '{' in target
+        # A target that starts with a placeholder only knows its scheme once it has been formatted
+        self.is_absolute = None if target.startswith('{') else target.startswith(ABSOLUTE_URL_PREFIXES)
+
+    def __call__(self, **kwargs):
+        url = self.target.format(**kwargs) if self.needs_format else self.target
+
+        is_absolute = self.is_absolute
+        if is_absolute is None:
+            is_absolute = url.startswith(ABSOLUTE_URL_PREFIXES)
+
+        if is_absolute:
+            return redirect(url, code=self.status_code)
+
+        return forced_host_redirect(url, code=self.status_code)
+
+
+class _PermanentRedirectView(_RedirectView):
+    """
+    The view function of a 301 redirect to a static absolute URL. Its response never changes and is
+    cached aggressively by browsers and CDNs, so it is sent without a body.
+    """
+
+    __slots__ = ('headers',)
+
+    def __init__(self, target: str):
+        super().__init__(target, 301)
+        self.headers = (
+            ('Location', target),
+            ('Content-Type', 'text/html; charset=utf-8'),
+        )
+
+    def __call__(self, **kwargs):
+        return Response(b'', status=self.status_code, headers=list(self.headers))
 
 
 class FlaskJSONRedirects:
     """A Flask extension to handle a redirects JSON file to be able to add redirected routes easily"""
 
     app: Flask = None
-    _default_status_code: int = None
-    _handle_trailing_slash: bool = None
+    default_status_code: int = None
+    handle_trailing_slash: bool = None
     _data: typing.Dict = None
+    _collisions: int = None
 
     def __init__(self, app: Flask = None, *, file: typing.Union[str, io.IOBase] = None):
 
         self._data = {}
+        self._collisions = 0
 
         if app:
             self.init_app(app, file=file)
@@ -40,39 +97,15 @@ class FlaskJSONRedirects:
 
         self.app = app
 
+        # Resolved once here, since they are read for every redirect that gets created
+        if self.default_status_code is None:
+            self.default_status_code = int(app.config.get('REDIRECTS_DEFAULT_STATUS_CODE', 302))
+        if self.handle_trailing_slash is None:
+            self.handle_trailing_slash = str2bool(app.config.get('REDIRECTS_HANDLE_TRAILING_SLASH', False))
+
         if file is not None:
             self.process_redirects_from_file(file)
 
-    @property
-    def default_status_code(self):
-        if self._default_status_code is not None:
-            return self._default_status_code
-
-        if self.app is None:
-            raise ValueError('FlaskJSONRedirects is not fully initialized')
-
-        self._default_status_code = int(self.app.config.get('REDIRECTS_DEFAULT_STATUS_CODE', 302))
-        return self._default_status_code
-
-    @default_status_code.setter
-    def default_status_code(self, value):
-        self._default_status_code = int(value)
-
-    @property
-    def handle_trailing_slash(self):
-        if self._handle_trailing_slash is not None:
-            return self._handle_trailing_slash
-
-        if self.app is None:
-            raise ValueError('FlaskJSONRedirects is not fully initialized')
-
-        self._handle_trailing_slash = str2bool(self.app.config.get('REDIRECTS_HANDLE_TRAILING_SLASH', False))
-        return self._handle_trailing_slash
-
-    @handle_trailing_slash.setter
-    def handle_trailing_slash(self, value):
-        self._handle_trailing_slash = bool(value)
-
     def process_redirects_from_file(self, file: typing.Union[str, io.IOBase], *, encoding: str = None):
         """Process a JSON file of redirects to create them within Flask"""
 
@@ -81,41 +114,64 @@ class FlaskJSONRedirects:
 
         try:
             if isinstance(file, str):
-                with open(file, 'r', encoding=encoding) as redirectsfile:
-                    redirects = json.load(redirectsfile)
-            else:
-                redirects = json.load(file)
+                if HAS_IJSON and codecs.lookup(encoding).name == 'utf-8':
+                    # ijson parses bytes, and only decodes UTF-8 itself
+                    redirectsfile = open(file, 'rb')
+                else:
+                    redirectsfile = open(file, 'r', encoding=encoding)
 
-            self.process_redirects(redirects)
+                with redirectsfile:
+                    self.process_redirects_stream(redirectsfile)
+            else:
+                self.process_redirects_stream(file)
 
-        except (IOError, json.JSONDecodeError) as exc:
+        except (IOError, LookupError, *JSON_ERRORS) as exc:
             self.app.logger.exception(exc)
             capture_exception(exc)
 
+    def process_redirects_stream(self, file: io.IOBase):
+        """
+        Process an open JSON file of redirects. When ijson is available and the file is binary, it is
+        parsed without ever holding its whole text in memory. The redirects are only created once the
+        file has been parsed cleanly, so a truncated or malformed file creates none of them, and the
+        last definition of a URI wins, as with json.load().
+        """
+
+        if not HAS_IJSON or isinstance(file, io.TextIOBase):
+            self.process_redirects(json.load(file))
+            return
+
+        self.process_redirects(dict(ijson.kvitems(file, '', use_float=True)))
+
     def process_redirects(self, redirects: typing.Dict):
         """Process a dict of redirects to create them within Flask"""
 
         for uri, data in redirects.items():
-            try:
-                if isinstance(data, str):
-                    target = data
-                    handle_trailing_slash = None
-                    status_code = None
+            self.process_redirect(uri, data)
 
-                else:
-                    target = data['target']
-                    handle_trailing_slash = data.get('trailing_slash', None)
-                    status_code = data.get('status', None)
+    def process_redirect(self, uri: str, data: typing.Union[str, typing.Dict]):
+        """Process a single redirect definition to create it within Flask"""
+
+        try:
+            if isinstance(data, str):
+                target = data
+                handle_trailing_slash = None
+                status_code = None
 
-                self.create_redirect(
-                    uri,
-                    target,
-                    handle_trailing_slash=handle_trailing_slash,
-                    status_code=status_code)
+            else:
+                target = data['target']
+                handle_trailing_slash = data.get('trailing_slash', None)
+                status_code = data.get('status', None)
 
-            except Exception as exc:
-                self.app.logger.exception(exc)
-                capture_exception(exc)
+            self.create_redirect(
+                uri,
+                target,
+                handle_trailing_slash=handle_trailing_slash,
+                status_code=status_code)
+
+        except Exception as exc:
+            self.app.logger.exception(exc)
+            capture_exception(exc)
 
     def create_redirect(self, uri, target, *,
                         handle_trailing_slash: bool = None,
@@ -125,9 +181,13 @@ class FlaskJSONRedirects:
         handle_trailing_slash = handle_trailing_slash if handle_trailing_slash is not None else self.handle_trailing_slash
         status_code = int(status_code) if status_code is not None else self.default_status_code
 
-        redirect_id = f'redirects-{slugify(uri)}'
+        redirect_id = f'redirects-{fast_slugify(uri)}'
         if redirect_id in self._data:
-            redirect_id = f'{redirect_id}-{random_string(10)}'
+            # A counter keeps the endpoint names deterministic from one boot to the next
+            base_id = redirect_id
+            while redirect_id in self._data:
+                self._collisions += 1
+                redirect_id = f'{base_id}-{self._collisions}'
         self._data.update({redirect_id: target})
         self.app.add_url_rule(
             uri,
@@ -144,13 +204,10 @@ class FlaskJSONRedirects:
             )
 
     def handle_redirect(self, redirect_id, status_code):
-        """Return the redirect function with the appropriate response for a Flask routing rule"""
-
-        def redirect_func(**kwargs):
-            url = self._data[redirect_id].format(**kwargs)
-            if url.startswith('http:') or url.startswith('https:'):
-                return redirect(url, code=status_code)
+        """Return the redirect view with the appropriate response for a Flask routing rule"""
 
-            return forced_host_redirect(url, code=status_code)
+        target = self._data[redirect_id]
+        if status_code == 301 and '{' not in target and target.startswith(ABSOLUTE_URL_PREFIXES):
+            return _PermanentRedirectView(target)
 
-        return redirect_func
+        return _RedirectView(target, status_code)
@@ -1,16 +1,28 @@
 # -*- coding: utf-8 -*-
 
-from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from email.utils import format_datetime
+from functools import cached_property, lru_cache
 import json
-import time
+import operator
+import threading
+import typing
 
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from flask import Flask, abort, Blueprint, Response, redirect, request
-import pytz
-from slugify import slugify
 
-from application.utils import forced_host_redirect, str2bool, str2json
+from application.lib.cache import SingleFlight, TTLCache
+from application.utils import (
+    NOT_MODIFIED_CODES,
+    fast_slugify,
+    forced_host_redirect,
+    json_loads,
+    str2bool,
+    str2json,
+)
 
 
 # When working behind APIGateway, we have a hard limit of a 10 MB response payload and when
@@ -18,26 +30,128 @@ from application.utils import forced_host_redirect, str2bool, str2json
 # that no issues will arise.
 OVERFLOW_SIZE = 4.5 * 1024 * 1024
 
-HTTP_HEADER_DATE_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
+
+# How many keys a single ListObjectsV2 request may return when looking for a page's key.
+LIST_MAX_KEYS = 50
+
+# Objects that aren't cached are streamed to the client in chunks of this size.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# The pages most likely to be requested first, which are retrieved into the cache on startup.
+WARM_KEYS = ('index.html', '404/index.html', '404.html', '500/index.html', '500.html')
+
+# Presigned URLs are valid for PRESIGNED_URL_EXPIRY seconds, and are reused for PRESIGNED_URL_REUSE
+# seconds, so that a reused URL is still valid for a few seconds once the client follows it.
+PRESIGNED_URL_EXPIRY = 60
+PRESIGNED_URL_REUSE = 55
+PRESIGNED_URL_MAX_ENTRIES = 512
+
+# How many keys found not to exist in S3, or to be too large to proxy, are remembered.
+KEY_CACHE_MAX_ENTRIES = 4096
+
+# The cached_property of FlaskS3Proxy used concurrently by the requests and probes, see setup_shared_state()
+SHARED_STATE = ('cache', 'listing_cache', 'missing_cache', 'presigned_urls', 'oversize_keys', 'in_flight')
+
+
+@lru_cache(maxsize=None)
+def shared_s3_client(max_pool_connections=50):
+    """
+    The client shared by all the FlaskS3Proxy instances (boto3 clients are thread-safe), with a
+    connection pool large enough for concurrent requests and the locale proxies. It is only built
+    on first use, rather than on import.
+    """
+
+    return boto3.client('s3', config=Config(
+        max_pool_connections=max_pool_connections,
+        retries={'mode': 'standard', 'max_attempts': 3},
+        tcp_keepalive=True,
+    ))
+
+
+@lru_cache(maxsize=256)
+def http_date(dt):
+    # S3 dates are in UTC, but botocore's tzinfo isn't the one format_datetime requires for GMT
+    return format_datetime(dt.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+@lru_cache(maxsize=1024)
+def endpoint_slug(path):
+    return fast_slugify(path) or 'index'
+
+
+def path_to_check(path):
+    # A top-level catch-all rule, e.g. `/<path:url>`, is the same whatever its variable is named
+    if path.startswith('/<path:') and path.find('/', 1) == -1:
+        return '/<path:'
+    return path
+
+
+def has_file_extension(url):
+    return '.' in url.rsplit('/', 1)[-1]
+
+
+class ProbePool:
+    """
+    The threads used to probe the possible keys of a page concurrently, and to warm the cache. Shared
+    across requests, so work is only handed to it while it has idle workers, see submit().
+    """
+
+    __slots__ = ('executor', 'slots')
+
+    def __init__(self, workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='s3proxy-probe')
+        self.slots = threading.BoundedSemaphore(workers)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run fn on the pool and return its future, or None if all the workers are busy. Callers then
+        run it themselves, rather than queue behind the probes of other requests.
+        """
+
+        if not self.slots.acquire(blocking=False):
+            return None
+
+        return self._submit(fn, *args, **kwargs)
+
+    def submit_when_idle(self, fn, *args, **kwargs):
+        """Run fn on the pool once one of its workers is idle, waiting for it if need be"""
+
+        self.slots.acquire()
+        return self._submit(fn, *args, **kwargs)
+
+    def _submit(self, fn, *args, **kwargs):
+        future = self.executor.submit(fn, *args, **kwargs)
+        # Also called when the future is cancelled
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+
+class CachedObject:
+    """An S3 object kept in the cache, with the headers of its responses already built"""
+
+    __slots__ = ('body', 'headers', 'etag', 'last_modified')
+
+    def __init__(self, body: bytes, headers: tuple, *, etag=None, last_modified=None):
+        self.body = body
+        self.headers = headers
+        self.etag = etag
+        self.last_modified = last_modified
 
 
 class FlaskS3Proxy:
-    _client = None
-    app: Flask = None
-    _bucket: str = None
-    _prefix: str = None
-    _trailing_slash_redirection: bool = None
-    _redirect_code: int = None
-    _routes: list = None
-    _locales: list = None
+    # The settings are cached_property, which need the instance __dict__
+    __slots__ = ('_client', 'app', '__dict__')
+
+    _client: typing.Any
+    app: typing.Optional[Flask]
+    probes: typing.Optional[ProbePool]
 
     def __init__(self, app, *, boto3_client=None, bucket=None, prefix=None, paths=None, **kwargs):
-        if boto3_client is None:
-            self._client = boto3.client('s3')
-        else:
-            self._client = boto3_client
+        self.app = None
+        # Without a client given, the shared one is used once the app config can be read
+        self._client = boto3_client
+        self.probes = None
 
-        self.locales = []
         if bucket is not None:
             self.bucket = bucket
         if prefix is not None:
@@ -52,110 +166,128 @@ class FlaskS3Proxy:
         if prefix is not None:
             self.prefix = prefix
 
-        try:
-            if self.prefix.startswith('/'):
-                self.prefix = self.prefix[1:]
-        except Exception:  # pylint: disable=broad-except
-            pass
-
-        try:
-            if self.prefix.endswith('/'):
-                self.prefix = self.prefix[:-1]
-        except Exception:  # pylint: disable=broad-except
-            pass
-
-    @property
-    def bucket(self):
-        if self._bucket is not None:
-            return self._bucket
+        if self.prefix:
+            self.prefix = self.prefix.strip('/')
 
+    def config_value(self, key, default=None):
         if self.app is None:
             raise ValueError('FlaskS3Proxy is not fully initialized')
 
-        self._bucket = self.app.config.get('S3PROXY_BUCKET')
-        return self._bucket
-
-    @bucket.setter
-    def bucket(self, value):
-        self._bucket = value
+        return self.app.config.get(key, default)
+
+    def setup_shared_state(self, fallback=None):
+        """
+        Build the state shared by the threads serving requests and probing S3, before any of them runs.
+        cached_property has no lock, so threads first reading one at the same time could each build
+        their own, e.g. two SingleFlight. A locale proxy shares the state of its fallback, so that all
+        the proxies draw from the same memory budget.
+        """
+
+        if fallback is not None:
+            if self._client is None:
+                self._client = fallback._client
+            self.probes = fallback.probes
+            for name in SHARED_STATE:
+                setattr(self, name, getattr(fallback, name))
+
+        if self._client is None:
+            self._client = shared_s3_client(int(self.config_value('S3PROXY_POOL_CONNECTIONS', 50)))
+        if self.probes is None:
+            self.probes = ProbePool(int(self.config_value('S3PROXY_PROBE_WORKERS', 4)))
+        for name in SHARED_STATE:
+            # Reading a cached_property keeps its value on the instance
+            getattr(self, name)
+
+    # The settings below are read from the app config on first access and then kept on the
+    # instance. Assigning any of them overrides the configured value.
+
+    @cached_property
+    def bucket(self):
+        return self.config_value('S3PROXY_BUCKET')
 
-    @property
+    @cached_property
     def prefix(self):
-        if self._prefix is not None:
-            return self._prefix
-
-        if self.app is None:
-            raise ValueError('FlaskS3Proxy is not fully initialized')
+        return self.config_value('S3PROXY_PREFIX')
 
-        self._prefix = self.app.config.get('S3PROXY_PREFIX')
-        return self._prefix
-
-    @prefix.setter
-    def prefix(self, value):
-        self._prefix = value
-
-    @property
+    @cached_property
     def routes(self):
-        if self._routes is not None:
-            return self._routes
+        return str2json(self.config_value('S3PROXY_ROUTES'))
 
-        if self.app is None:
-            raise ValueError('FlaskS3Proxy is not fully initialized')
+    @cached_property
+    def locales(self):
+        locales = self.config_value('S3PROXY_LOCALES')
+        if isinstance(locales, str):
+            # Attempt to JSON decode the value, since it might have been a JSON string in an env var.
+            # Not through str2json(), which logs through current_app, and there is no app context yet.
+            try:
+                locales = json_loads(locales)
+            except json.JSONDecodeError:
+                pass
 
-        self._routes = str2json(self.app.config.get('S3PROXY_ROUTES'))
-        return self._routes
+        # A single locale can be configured as a plain string
+        return [locales] if isinstance(locales, str) else locales
 
-    @routes.setter
-    def routes(self, value):
-        self._routes = value
+    @cached_property
+    def cache(self):
+        return TTLCache(
+            ttl=float(self.config_value('S3PROXY_CACHE_TTL', 60)),
+            max_size=int(self.config_value('S3PROXY_CACHE_MAX_SIZE', 16 * 1024 * 1024)),
+        )
 
-    @property
-    def locales(self):
-        if self._locales is not None:
-            return self._locales
+    @cached_property
+    def listing_cache(self):
+        # The keys found for a url by list probing. Each entry counts as 1 towards the max size.
+        return TTLCache(
+            ttl=self.cache.ttl,
+            max_size=int(self.config_value('S3PROXY_LISTING_CACHE_MAX_ENTRIES', 4096)),
+        )
 
-        if self.app is None:
-            raise ValueError('FlaskS3Proxy is not fully initialized')
+    @cached_property
+    def missing_cache(self):
+        # The keys recently found not to exist. Kept briefly, so that newly uploaded files show up fast.
+        return TTLCache(
+            ttl=float(self.config_value('S3PROXY_MISSING_CACHE_TTL', 10)),
+            max_size=KEY_CACHE_MAX_ENTRIES,
+        )
 
-        self._locales = str2json(self.app.config.get('S3PROXY_LOCALES'))
-        return self.locales
+    @cached_property
+    def presigned_urls(self):
+        # Entries are never refreshed on access, a URL must not outlive its signature
+        return TTLCache(ttl=PRESIGNED_URL_REUSE, max_size=PRESIGNED_URL_MAX_ENTRIES)
 
-    @locales.setter
-    def locales(self, value):
-        self._locales = value
+    @cached_property
+    def oversize_keys(self):
+        # The keys of objects too large to proxy, which are served through presigned URLs
+        return TTLCache(ttl=self.cache.ttl, max_size=KEY_CACHE_MAX_ENTRIES)
 
-    @property
-    def trailing_slash_redirection(self):
-        if self._trailing_slash_redirection is not None:
-            return self._trailing_slash_redirection
+    @cached_property
+    def in_flight(self):
+        return SingleFlight()
 
-        if self.app is None:
-            raise ValueError('FlaskS3Proxy is not fully initialized')
+    @cached_property
+    def cache_max_object_size(self):
+        return int(self.config_value('S3PROXY_CACHE_MAX_OBJECT_SIZE', 1024 * 1024))
 
-        self._trailing_slash_redirection = str2bool(self.app.config.get('S3PROXY_TRAILING_SLASH_REDIRECTION', True))
-        return self._trailing_slash_redirection
+    @cached_property
+    def trailing_slash_redirection(self):
+        return str2bool(self.config_value('S3PROXY_TRAILING_SLASH_REDIRECTION', True))
 
-    @trailing_slash_redirection.setter
-    def trailing_slash_redirection(self, value):
-        self._trailing_slash_redirection = bool(value)
+    @cached_property
+    def list_probing(self):
+        return str2bool(self.config_value('S3PROXY_LIST_PROBING', True))
 
-    @property
+    @cached_property
     def redirect_code(self):
-        if self._redirect_code is not None:
-            return self._redirect_code
+        code = int(self.config_value('S3PROXY_REDIRECT_CODE', 302))
+        if not 300 <= code < 400:
+            self.app.logger.warning(f'S3PROXY_REDIRECT_CODE is outside of the redirect range: {code}')
+            return 302
 
-        if self.app is None:
-            raise ValueError('FlaskS3Proxy is not fully initialized')
-
-        self._redirect_code = int(self.app.config.get('S3PROXY_REDIRECT_CODE', 302))
-        return self._redirect_code
-
-    @redirect_code.setter
-    def redirect_code(self, value):
-        self._redirect_code = int(value)
+        return code
 
     def init_app(self, app, *, bucket=None, prefix=None, paths=None, **kwargs):
         self.app = app
+        self.setup_shared_state()
         self.set_options(bucket=bucket, prefix=prefix)
 
         if not self.bucket:
@@ -176,56 +308,93 @@ class FlaskS3Proxy:
         def server_error(error):
             return self.handle_500(error)
 
-    def handle_404(self, error):
-        try:
-            resp = self.retrieve('404/index.html', abort_on_fail=False)
-            if not resp:
-                resp = self.retrieve('404.html', abort_on_fail=False)
-                if not resp:
-                    raise Exception()  # This is just to prevent a 500 from occuring
-            resp.status = 404
-            return resp
+        if self.cache.enabled and str2bool(self.config_value('S3PROXY_CACHE_WARM', True)):
+            self.warm_cache()
 
-        except Exception:  # pylint: disable=broad-except
-            return Response('Page Not Found', status=404, content_type='text/plain')
+    def warm_cache(self, keys=WARM_KEYS):
+        """Retrieve the given keys into the cache in the background, so the first requests hit it"""
+
+        def warm(key):
+            response = self.retrieve(key, abort_on_fail=False)
+            if response is not None:
+                # Releases the S3 stream of objects too large to be cached
+                response.close()
+
+        def warm_all():
+            # There may be more keys than workers. The rest wait for a worker on this thread, rather
+            # than holding up startup or taking workers away from the probes of requests.
+            for key in keys:
+                self.probes.submit_when_idle(warm, key)
+
+        threading.Thread(target=warm_all, name='s3proxy-warm', daemon=True).start()
+
+    def handle_404(self, error):
+        return self._error_page(404, 'Page Not Found')
 
     def handle_500(self, error):
-        try:
-            resp = self.retrieve('500/index.html', abort_on_fail=False)
-            if not resp:
-                resp = self.retrieve('500.html', abort_on_fail=False)
-                if not resp:
-                    raise Exception()  # This is just to prevent a true 500 from occuring
-            resp.status = 500
-            return resp
+        return self._error_page(500, 'Internal Server Error')
 
+    def _error_page(self, status, message):
+        # Both of the page's possible keys are probed at once, rather than one after the other
+        try:
+            resp = self.retrieve_first((f'{status}/index.html', f'{status}.html'))
         except Exception:  # pylint: disable=broad-except
-            return Response('Internal Server Error', status=500, content_type='text/plain')
+            resp = None  # This is just to prevent a true 500 from occuring
+
+        if not resp:
+            return Response(message, status=status, content_type='text/plain')
+
+        resp.status = status
+        return resp
+
+    def configured_paths(self):
+        """
+        The set of paths in the routing map. It is kept on the app, shared by all the proxies, and
+        the rules are only walked again once their number has changed. Even then, only the path of
+        rules it hasn't seen yet is checked. Rules are told apart by identity rather than position,
+        since iter_rules() groups them by endpoint and a new rule may be listed between older ones.
+        """
+
+        state = getattr(self.app, 's3_proxy_routing_state', None)
+        if state is None:
+            state = self.app.s3_proxy_routing_state = {'paths': set(), 'rules': set(), 'count': None}
+
+        rules = self.app.url_map.iter_rules()
+        # The rules are iterated from a list, which knows its length without being walked.
+        # Rules are never removed from the routing map, so an unchanged count means no new rule.
+        count = operator.length_hint(rules, -1)
+        if count != -1 and count == state['count']:
+            return state['paths']
+
+        for rule in rules:
+            # The routing map keeps its rules alive, so their ids can't be reused
+            if id(rule) not in state['rules']:
+                state['rules'].add(id(rule))
+                state['paths'].add(path_to_check(rule.rule))
+
+        state['count'] = count
+        return state['paths']
 
     def add_handled_routes(self, paths, **kwargs):
         if not isinstance(paths, (list, set, tuple,)):
             return
 
-        def path_to_check(path):
-            return '/<path:' if path.startswith('/<path:') and '/' not in path[1:] else path
-
         # Don't overload the routing map if the path we want to set is already present.
         # Handle `/<path:[^/]` specially, since that could have any variable name used within it
         # and it is usually one of our default routes.
-        configured_paths = [path_to_check(rule.rule) for rule in self.app.url_map.iter_rules()]
+        configured_paths = self.configured_paths()
 
         for path in paths:
-            if path_to_check(path) not in configured_paths:
+            checked_path = path_to_check(path)
+            if checked_path not in configured_paths:
                 self.add_handled_route(path, **kwargs)
+                configured_paths.add(checked_path)
             else:
                 self.app.logger.warning(
                     f"Not using S3 Proxy for '{path}'. It was already defined in the routing map.")
 
     def add_handled_route(self, path, **kwargs):
-        slug = slugify(path)
-        if not slug:
-            slug = 'index'
-        self.app.add_url_rule(path, endpoint=slug, view_func=self.proxy_it, **kwargs)
+        self.app.add_url_rule(path, endpoint=endpoint_slug(path), view_func=self.proxy_it, **kwargs)
 
     def proxy_it(self, url=None):
         if url is None:
@@ -237,81 +406,290 @@ class FlaskS3Proxy:
             else:
                 url = url[:-1]
 
+        keys = self.possible_keys(url)
+        if has_file_extension(url):
+            # Files are nearly always requested by their exact key, so only look further on a miss
+            response = self.retrieve_first(keys[:1]) or self.retrieve_first(keys[1:])
+        else:
+            response = self.retrieve_first(keys)
+
+        if response is not None:
+            return response
+
+        return abort(404)
+
+    def retrieve_first(self, keys):
+        """
+        Retrieve the first of the keys, in order of preference, that exists. When there are several,
+        the first one is probed on the calling thread while the others are probed on the probe pool,
+        so a miss doesn't delay the next key by a full round trip. Keys the pool has no idle worker for
+        are probed on the calling thread, once their turn comes.
+        """
+
+        if len(keys) < 2:
+            return self.retrieve(keys[0], abort_on_fail=False) if keys else None
+
+        winner = None
+
+        def release(future):
+            response = future.result()
+            if response is not None and response is not winner:
+                # Releases the S3 stream of objects too large to be cached
+                response.close()
+
+        futures = [self.probes.submit(self.retrieve, key, abort_on_fail=False) for key in keys[1:]]
+        try:
+            response = self.retrieve(keys[0], abort_on_fail=False)
+            if response is not None:
+                winner = response
+                return winner
+
+            for key, future in zip(keys[1:], futures):
+                if future is None:
+                    response = self.retrieve(key, abort_on_fail=False)
+                else:
+                    response = future.result()
+
+                if response is not None:
+                    winner = response
+                    return winner
+
+        finally:
+            # Nothing to wait for anymore, don't bother starting the probes still queued
+            for future in futures:
+                if future is not None and not future.cancel():
+                    future.add_done_callback(release)
+
+        return None
+
+    def possible_keys(self, url):
+        """
+        Return the keys that may hold the contents for a url, in order of preference. For urls
+        without a file extension, a single ListObjectsV2 request is used to drop the keys that
+        don't exist, instead of probing each of them with a GetObject.
+        """
+
         # Check for:
         # - /my-page
-        # - /my-page.html
         # - /my-page/index.html
-        for possible in (url, f'{url}/index.html', f'{url}.html'):
-            response = self.retrieve(possible, abort_on_fail=False)
-            if response and getattr(response, 'status_code', None):
-                return response
+        # - /my-page.html
+        possibilities = (url, f'{url}/index.html', f'{url}.html')
 
-        return abort(404)
+        if not self.list_probing or has_file_extension(url):
+            # Files with an extension are nearly always requested by their exact key, so listing
+            # would only add a round trip.
+            return possibilities
+
+        prefix = f'{self.prefix}/' if self.prefix else ''
+        cache_key = f'{self.bucket}/{prefix}{url}'
+        found = self.listing_cache.get(cache_key)
+        if found is not None:
+            return found
+
+        if self.missing_cache.get(f'list:{cache_key}'):
+            # Recently listed with no results, see below
+            return ()
+
+        try:
+            listing = self._client.list_objects_v2(
+                Bucket=self.bucket,
+                Prefix=f'{prefix}{url}',
+                Delimiter='/',
+                MaxKeys=LIST_MAX_KEYS,
+            )
+
+        except ClientError as exc:
+            if exc.response['Error']['Code'] == 'AccessDenied':
+                self.app.logger.warning(
+                    'Not allowed to list the S3 bucket contents. Disabling S3PROXY_LIST_PROBING.')
+                self.list_probing = False
+            else:
+                self.app.logger.exception(exc)
+            return possibilities
+
+        except BotoCoreError as exc:
+            # e.g. connection errors and timeouts, the GetObject probes are left to deal with them
+            self.app.logger.exception(exc)
+            return possibilities
+
+        listed = [obj['Key'][len(prefix):] for obj in listing.get('Contents', [])]
+        # With the delimiter, everything under `<url>/` is rolled up into a single common prefix, however
+        # many keys there are. Its index.html is then fetched to find out whether it exists.
+        folders = [common['Prefix'][len(prefix):] for common in listing.get('CommonPrefixes', [])]
+        keys = set(listed).union(f'{folder}index.html' for folder in folders)
+
+        if not listing.get('IsTruncated'):
+            found = tuple(possible for possible in possibilities if possible in keys)
+        else:
+            # Keys are listed in lexicographic order, so a possibility sorting after the last listed
+            # key may still exist.
+            last = max(listed + folders)
+            found = tuple(
+                possible for possible in possibilities if possible in keys or possible > last)
+
+        if found:
+            self.listing_cache.set(cache_key, found, size=1)
+        else:
+            # Kept for the short TTL of the missing keys rather than the listing TTL, so that a newly
+            # published page shows up fast. Under its own key, since the url's own key being missing
+            # doesn't mean that its other possible keys are.
+            self.missing_cache.set(f'list:{cache_key}', True, size=1)
+
+        return found
 
     def redirect_with_querystring(self, target, *, code=None):
-        if request.query_string:
-            target = f"{target}?{request.query_string.decode('utf-8')}"
+        # WSGI already provides the query string as a str, it only needs decoding again when it isn't
+        # percent-encoded ASCII, as WSGI decodes it as latin-1.
+        query_string = request.environ.get('QUERY_STRING')
+        if query_string:
+            if not query_string.isascii():
+                query_string = request.query_string.decode('utf-8')
+            target = f'{target}?{query_string}'
         return forced_host_redirect(target, code=code if code else self.redirect_code)
 
     def datetime_to_header(self, dt):
-        return time.strftime(
-            HTTP_HEADER_DATE_FORMAT,
-            dt.replace(tzinfo=pytz.UTC).timetuple(),
-        )
+        return http_date(dt)
+
+    def get_file(self, key, **kwargs):
+        return self._client.get_object(Bucket=self.bucket, Key=key, **kwargs)
+
+    def response_headers(self, s3_obj):
+        headers = []
+        if 'ContentType' in s3_obj:
+            headers.append(('Content-Type', str(s3_obj['ContentType'])))
+        if 'CacheControl' in s3_obj:
+            headers.append(('Cache-Control', str(s3_obj['CacheControl'])))
+        if 'Expires' in s3_obj:
+            headers.append(('Expires', self.datetime_to_header(s3_obj['Expires'])))
+        if 'LastModified' in s3_obj:
+            headers.append(('Last-Modified', self.datetime_to_header(s3_obj['LastModified'])))
+        return headers
+
+    def make_response(self, body, headers, **kwargs):
+        return Response(response=body, headers=headers, **kwargs)
 
+    def retrieve(self, url, *, abort_on_fail=True):
+        s3_url = f'{self.prefix}/{url}' if self.prefix else url
+        cache_key = f'{self.bucket}/{s3_url}'
+
+        cached, fresh = self.cache.get_entry(cache_key)
+        if not fresh:
+            if self.in_flight.begin(cache_key):
+                try:
+                    response = self.fetch(s3_url, cache_key, cached)
+                finally:
+                    self.in_flight.end(cache_key)
+            else:
+                # Another request was already fetching the same key. Unless they couldn't be cached,
+                # its contents are in the cache by now, as are missing and oversize keys.
+                cached, fresh = self.cache.get_entry(cache_key)
+                response = None if fresh else self.fetch(s3_url, cache_key, cached)
 
-    def get_file(self, key):
-        return self._client.get_object(Bucket=self.bucket, Key=key)
+        if fresh:
+            self.app.logger.info('Returning cached S3 contents')
+            return self.make_response(cached.body, cached.headers)
 
+        if response is None and abort_on_fail:
+            return abort(404)
 
-    def retrieve(self, url, *, abort_on_fail=True):
-        s3_url = f'{self.prefix}/{url}' if self.prefix else url
+        return response
+
+    def fetch(self, s3_url, cache_key, cached=None):
+        """
+        Fetch an object from S3, revalidating the expired cache entry given, if any. Returns None
+        if the object could not be retrieved.
+        """
+
+        if cached is None and self.missing_cache.get(cache_key):
+            # Spares a GetObject for each request to a missing page, e.g. from bots
+            return None
+
+        if cached is None and self.oversize_keys.get(cache_key):
+            # Known to be too large to proxy, so there is no need to open it again to find out
+            return self.presigned_redirect(s3_url, cache_key)
+
+        conditions = {}
+        if cached is not None:
+            # An expired entry is revalidated, S3 only sends the body again if it has changed
+            if cached.etag:
+                conditions['IfNoneMatch'] = cached.etag
+            elif cached.last_modified:
+                conditions['IfModifiedSince'] = cached.last_modified
 
         try:
-            s3_obj = self.get_file(s3_url)
+            try:
+                s3_obj = self.get_file(s3_url, **conditions)
+
+            except ClientError as exc:
+                code = exc.response['Error']['Code']
+                if code == 'NoSuchKey':
+                    self.cache.delete(cache_key)
+                    self.missing_cache.set(cache_key, True, size=1)
+
+                if cached is None or code not in NOT_MODIFIED_CODES:
+                    raise
+
+                self.app.logger.info('Returning revalidated cached S3 contents')
+                self.cache.refresh(cache_key)
+                return self.make_response(cached.body, cached.headers)
 
             if 'ContentLength' not in s3_obj or int(s3_obj['ContentLength']) > OVERFLOW_SIZE:
-                # URL only works for 60 seconds
-                url = self._client.generate_presigned_url('get_object',
-                          Params={
-                              'Bucket': self.bucket,
-                              'Key': s3_url
-                          },
-                          ExpiresIn=60)
-
-                self.app.logger.info('Redirecting to S3 contents via signed URL')
-                # This cannot redirect with the other status codes because it's an oversize page
-                # and the URL will be different on each request. Therefore we use: "303 See Other"
-                return redirect(url, 303)
+                # The body is never read from here on. Close it straight away, rather than leave the
+                # object downloading over a pooled connection until it gets garbage collected.
+                s3_obj['Body'].close()
+                self.oversize_keys.set(cache_key, True, size=1)
+                return self.presigned_redirect(s3_url, cache_key)
+
+            if not self.cache.enabled or int(s3_obj['ContentLength']) > self.cache_max_object_size:
+                self.app.logger.info('Streaming S3 contents')
+                headers = self.response_headers(s3_obj)
+                headers.append(('Content-Length', str(s3_obj['ContentLength'])))
+                # The chunks are passed through as they are, without werkzeug iterating over them first
+                response = self.make_response(
+                    s3_obj['Body'].iter_chunks(chunk_size=STREAM_CHUNK_SIZE), headers,
+                    direct_passthrough=True)
+                response.call_on_close(s3_obj['Body'].close)
+                return response
 
             self.app.logger.info('Returning S3 contents')
-            contents = s3_obj['Body'].read()
-            response = Response(response=contents)
-            if 'ContentType' in s3_obj:
-                response.headers['Content-Type'] = str(s3_obj['ContentType'])
-            if 'CacheControl' in s3_obj:
-                response.headers['Cache-Control'] = str(s3_obj['CacheControl'])
-            if 'Expires' in s3_obj:
-                response.headers['Expires'] = self.datetime_to_header(s3_obj['Expires'])
-            if 'LastModified' in s3_obj:
-                response.headers['Last-Modified'] = self.datetime_to_header(s3_obj['LastModified'])
-            return response
+            # The headers are built once, when caching, rather than for every response
+            cached = CachedObject(
+                s3_obj['Body'].read(),
+                tuple(self.response_headers(s3_obj)),
+                etag=s3_obj.get('ETag'),
+                last_modified=s3_obj.get('LastModified'),
+            )
+            self.cache.set(cache_key, cached, size=len(cached.body))
+            return self.make_response(cached.body, cached.headers)
 
         except Exception as exc:  # pylint: disable=broad-except
-            self.app.logger.warning('Unable to open: {}/{}: {}'.format(self.bucket, s3_url, exc))
-            pass
-
-        if abort_on_fail:
-            return abort(404)
+            self.app.logger.warning(f'Unable to open: {self.bucket}/{s3_url}: {exc}')
 
         return None
 
+    def presigned_redirect(self, s3_url, cache_key):
+        url = self.presigned_urls.get(cache_key)
+        if url is None:
+            # URL only works for 60 seconds
+            url = self._client.generate_presigned_url('get_object',
+                      Params={
+                          'Bucket': self.bucket,
+                          'Key': s3_url
+                      },
+                      ExpiresIn=PRESIGNED_URL_EXPIRY)
+            self.presigned_urls.set(cache_key, url, size=1)
+
+        self.app.logger.info('Redirecting to S3 contents via signed URL')
+        # This cannot redirect with the other status codes because it's an oversize page
+        # and the URL will be different on each request. Therefore we use: "303 See Other"
+        return redirect(url, 303)
+
     def setup_locales(self, *, file=None, locales=None, enable_auto_switch=None):
 
         if file is not None:
             try:
                 locales_file_obj = self.get_file(file)
-                self.locales = json.loads(locales_file_obj['Body'].read())
+                self.locales = json_loads(locales_file_obj['Body'].read())
                 self.app.logger.info('Loaded locales from S3')
 
             except ClientError as exc:
@@ -326,16 +704,9 @@ class FlaskS3Proxy:
                 self.app.logger.exception(exc)
                 return
 
+        # In case the file held a single locale, we want it as a list
         if isinstance(self.locales, str):
-            # Attempt to JSON decode the value, since it might have been a JSON string in an env var
-            try:
-                self.locales = json.loads(self.locales)
-            except json.JSONDecodeError:
-                pass
-
-            # In case it loaded to a new string, we want it as a list
-            if isinstance(self.locales, str):
-                self.locales = [self.locales]
+            self.locales = [self.locales]
 
         if locales is not None:
             self.locales = (self.locales + locales) if self.locales else locales
@@ -376,22 +747,24 @@ class FlaskS3Proxy:
 
 
 class FlaskS3ProxyBlueprint(FlaskS3Proxy):
-    bp: Blueprint = None
-    fallback: FlaskS3Proxy = None
+    __slots__ = ('bp', 'fallback')
+
+    bp: Blueprint
+    fallback: typing.Optional[FlaskS3Proxy]
 
     def __init__(self, app, *, boto3_client=None, bucket=None, prefix=None, paths=None, fallback=None, **kwargs):
         # Intentionally not providing app to parent init
         super().__init__(None, boto3_client=boto3_client, bucket=bucket, prefix=prefix)
 
         self.app = app
+        self.setup_shared_state(fallback)
 
         name = 's3proxy'
         if self.prefix:
-            name += f'-{slugify(self.prefix)}'
+            name += f'-{endpoint_slug(self.prefix)}'
         self.bp = Blueprint(name, __name__)
 
-        if fallback:
-            self.fallback = fallback
+        self.fallback = fallback
 
         if paths:
             self.register_blueprint(paths, **kwargs)
@@ -418,8 +791,7 @@ class FlaskS3ProxyBlueprint(FlaskS3Proxy):
         self.app.register_blueprint(self.bp)
 
     def add_handled_route(self, path, **kwargs):
-        slug = slugify(path)
-        self.bp.add_url_rule(path, endpoint=slug, view_func=self.proxy_it, **kwargs)
+        self.bp.add_url_rule(path, endpoint=endpoint_slug(path), view_func=self.proxy_it, **kwargs)
 
     def handle_404(self, error):
         resp = super().handle_404(error)
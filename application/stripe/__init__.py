@@ -20,4 +20,8 @@ def init_app(app, url_prefix='/stripe'):
     stripe.api_version = '2020-08-27'
     stripe.api_key = app.config['STRIPE_SECRET_KEY']
 
+    # Parsed once here, rather than for every checkout session
+    app.config['STRIPE_PAYMENT_METHOD_TYPES_LIST'] = app.config.get(
+        'STRIPE_PAYMENT_METHOD_TYPES', 'card').split(',')
+
     app.register_blueprint(stripe_bp, url_prefix=url_prefix)
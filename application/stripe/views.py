@@ -11,6 +11,8 @@ from flask import (
 
 stripe_bp = Blueprint('stripe', __name__)  # pylint: disable=invalid-name
 
+REQUIRED_ITEM_KEYS = frozenset(('price', 'quantity'))
+
 
 @stripe_bp.route('/', methods=['GET'])
 def index():
@@ -42,9 +44,8 @@ def create_checkout_session():
         return jsonify({'error': 'No items were defined'}), 400
 
     # Stripe uses the key `price` to represent a price ID. Don't get cornfused
-    for item in data['items']:
-       if 'quantity' not in item or 'price' not in item:
-           return jsonify({'error': 'Invalid item data provided'}), 400
+    if not all(isinstance(item, dict) and REQUIRED_ITEM_KEYS <= item.keys() for item in data['items']):
+        return jsonify({'error': 'Invalid item data provided'}), 400
 
     scheme = 'http' if request.host == 'localhost' else 'https'
     domain_url = f'{scheme}://{request.host}'
@@ -78,7 +79,7 @@ def create_checkout_session():
             allow_promotion_codes=True,
             success_url=success_url,
             cancel_url=cancel_url,
-            payment_method_types=current_app.config.get("STRIPE_PAYMENT_METHOD_TYPES", "card").split(','),
+            payment_method_types=current_app.config['STRIPE_PAYMENT_METHOD_TYPES_LIST'],
             mode="payment",
             line_items=data['items'],
         )
@@ -1,11 +1,84 @@
 # -*- coding: utf-8 -*-
 
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import hashlib
+import io
 import json
-import random
+import os
+import re
 import string
 
 import botocore
-from flask import Response, abort, current_app
+from flask import Response, current_app
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import NotFound
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+SLUG_DISALLOWED_RE = re.compile(r'[^a-z0-9]+')
+
+RANDOM_ALPHABET = (string.ascii_lowercase + string.ascii_uppercase + string.digits).encode()
+RANDOM_BYTE_LIMIT = 256 - 256 % len(RANDOM_ALPHABET)
+
+REDIRECT_BODY = b"""
+<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">
+<title>Redirecting...</title>
+<h1>Redirecting...</h1>
+<p>You should be redirected automatically to target URL: <a href="{url}">{url}</a>.  If not click the link.
+    """
+# Joined with the target URL to build the body of a redirect
+REDIRECT_BODY_PARTS = REDIRECT_BODY.split(b'{url}')
+
+# The error codes botocore reports for a conditional GetObject whose object hasn't changed.
+NOT_MODIFIED_CODES = ('304', 'NotModified')
+
+# Compared in lowercase
+FALSY_STRINGS = frozenset(('false', '0', '', 'no', 'off'))
+
+
+def json_loads(s):
+    """json.loads(), using orjson when it is available. Its errors subclass json.JSONDecodeError"""
+
+    if HAS_ORJSON:
+        return orjson.loads(s)
+
+    return json.loads(s)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider, serializing with orjson. Dates and dataclasses are still passed to Flask's
+    own default(), so that they are serialized the same way. Non-ASCII characters are output as UTF-8
+    rather than escaped.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if not HAS_ORJSON:
+            return super().dumps(obj, **kwargs)
+
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+
+        # response() always asks for either compact separators, which is all orjson outputs, or an
+        # indentation of 2, which it supports too.
+        unsupported = dict(kwargs)
+        if unsupported.get('separators') == (',', ':'):
+            del unsupported['separators']
+        if unsupported.get('indent') == 2:
+            del unsupported['indent']
+            options |= orjson.OPT_INDENT_2
+
+        if unsupported:
+            return super().dumps(obj, **kwargs)
+
+        return orjson.dumps(obj, default=self.default, option=options).decode('utf-8')
 
 
 def str2json(s):
@@ -13,7 +86,7 @@ def str2json(s):
         return s
 
     try:
-        s = json.loads(s)
+        s = json_loads(s)
     except json.JSONDecodeError as exc:
         current_app.logger.exception(exc)
 
@@ -21,16 +94,30 @@ def str2json(s):
 
 
 def str2bool(s):
-    if isinstance(s, str) and (s.lower() == 'false' or s == '0'):
-        return False
+    if isinstance(s, str):
+        return s.lower() not in FALSY_STRINGS
     return bool(s)
 
 
+def fast_slugify(s):
+    """slugify() with a fast path for plain ASCII strings, such as most URIs"""
+
+    if s.isascii():
+        return SLUG_DISALLOWED_RE.sub('-', s.lower()).strip('-')
+
+    # Only imported when needed, as python-slugify pulls in its unicode transliteration tables
+    from slugify import slugify  # pylint: disable=import-outside-toplevel
+    return slugify(s)
+
+
 def random_string(length=5):  # pylint: disable=no-self-use
-    return ''.join(
-        random.SystemRandom().choice(string.ascii_lowercase +
-                                     string.ascii_uppercase +
-                                     string.digits) for _ in range(length))
+    # Random bytes are read in bulk, rather than one read per character. Bytes past the last
+    # multiple of the alphabet's length are dropped, so that every character is equally likely.
+    chars = bytearray()
+    while len(chars) < length:
+        chars.extend(RANDOM_ALPHABET[byte % len(RANDOM_ALPHABET)]
+                     for byte in os.urandom(length * 2) if byte < RANDOM_BYTE_LIMIT)
+    return chars[:length].decode()
 
 
 def forced_host_redirect(url, **kwargs):
@@ -47,38 +134,38 @@ def forced_relative_redirect(url, **kwargs):
 
 
 def _redirect(url, **kwargs):
-    body = f"""
-<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">
-<title>Redirecting...</title>
-<h1>Redirecting...</h1>
-<p>You should be redirected automatically to target URL: <a href="{url}">{url}</a>.  If not click the link.
-    """
-
     if 'code' in kwargs and 'status' not in kwargs:
-        kwargs.update({'status': kwargs.pop('code')})
+        kwargs['status'] = kwargs.pop('code')
 
-    if 'headers' not in kwargs:
-        kwargs.update({'headers': {}})
+    # Built anew, rather than updating a headers dict the caller may hold on to
+    headers = kwargs.pop('headers', None)
+    kwargs['headers'] = {**headers, 'Location': url} if headers else {'Location': url}
 
-    kwargs['headers'].update({'Location': url})
-    resp = Response(
-        body,
-        **kwargs,
-    )
-    return resp
+    return Response(url.encode('utf-8').join(REDIRECT_BODY_PARTS), **kwargs)
 
 
 def force_404():
-    return abort(404)
+    # The proxy's 404 page, without raising and handling a NotFound to get to it
+    return current_app.s3_proxy.handle_404(NotFound())
+
 
+def init_extension(app, extension, filename_key, *, config_file=None):
+    """
+    Create an extension and initialize it with its config file from S3. `config_file` may be a future
+    of the already requested config file, see init_extensions().
+    """
 
-def init_extension(app, extension, filename_key):
     # Specifically not passing app to the initial init, since we'll don't want to double run it
     ext = extension()
     if app.config.get(filename_key):
         try:
-            config_obj = app.s3_proxy.get_file(app.config[filename_key])
-            ext.init_app(app, file=config_obj['Body'])
+            if config_file is None:
+                config_file = open_config_file(app, app.config[filename_key])
+            else:
+                config_file = config_file.result()
+
+            with contextlib.closing(config_file):
+                ext.init_app(app, file=config_file)
         except botocore.exceptions.ClientError as exc:
             if exc.response['Error']['Code'] == 'NoSuchKey':
                 app.logger.warning(
@@ -90,3 +177,65 @@ def init_extension(app, extension, filename_key):
         app.add_url_rule(f"/{app.config[filename_key]}", f'{filename_key}-file-block', force_404)
 
     return ext
+
+
+def init_extensions(app, extensions):
+    """
+    init_extension() for several (extension, filename_key) pairs at once. Their config files are
+    downloaded concurrently, but the extensions are still initialized one at a time, in order.
+    """
+
+    with ThreadPoolExecutor(max_workers=len(extensions) or 1) as executor:
+        config_files = [
+            executor.submit(open_config_file, app, app.config[filename_key])
+            if app.config.get(filename_key) else None
+            for _, filename_key in extensions
+        ]
+
+        return [
+            init_extension(app, extension, filename_key, config_file=config_file)
+            for (extension, filename_key), config_file in zip(extensions, config_files)
+        ]
+
+
+def open_config_file(app, key):
+    """
+    Open a config file from S3. When S3_CONFIG_CACHE_DIR is set, e.g. to /tmp on Lambda, a copy of the
+    file is kept there and only downloaded again once its ETag has changed.
+    """
+
+    cache_dir = app.config.get('S3_CONFIG_CACHE_DIR')
+    if not cache_dir:
+        return app.s3_proxy.get_file(key)['Body']
+
+    name = hashlib.sha256(f'{app.s3_proxy.bucket}/{key}'.encode('utf-8')).hexdigest()
+    path = os.path.join(cache_dir, f'{name}.json')
+    try:
+        with open(f'{path}.etag', 'r', encoding='utf-8') as etag_file:
+            etag = etag_file.read()
+        config_obj = app.s3_proxy.get_file(key, IfNoneMatch=etag)
+
+    except OSError:
+        config_obj = app.s3_proxy.get_file(key)
+
+    except botocore.exceptions.ClientError as exc:
+        if exc.response['Error']['Code'] not in NOT_MODIFIED_CODES:
+            raise
+
+        try:
+            return open(path, 'rb')  # pylint: disable=consider-using-with
+        except OSError:
+            config_obj = app.s3_proxy.get_file(key)
+
+    body = config_obj['Body'].read()
+    try:
+        # The ETag is written last, so that it is never found without the contents it belongs to
+        for target, contents in ((path, body), (f'{path}.etag', config_obj['ETag'].encode('utf-8'))):
+            with open(f'{target}.tmp', 'wb') as cache_file:
+                cache_file.write(contents)
+            os.replace(f'{target}.tmp', target)
+
+    except (KeyError, OSError) as exc:
+        app.logger.warning(f'Unable to cache {key} in {cache_dir}: {exc}')
+
+    return io.BytesIO(body)
@@ -1,16 +1,8 @@
 #!/usr/bin/env python3
 
-from awacs import (
-    aws,
-    awslambda,
-    cloudformation,
-    cloudfront,
-    events,
-    iam,
-    kms,
-    s3,
-    sts
-)
+import functools
+import json
+
 import click
 
 
@@ -19,7 +11,25 @@ def cli():
     pass
 
 
-def get_policy(client, account):
+# The policy is built once with these placeholders, which are then replaced for each client/account
+CLIENT_PLACEHOLDER = '{client}'
+ACCOUNT_PLACEHOLDER = '{account}'
+
+
+def get_policy_structured(client, account):
+    # Only imported when a policy is built, so `--help` doesn't pay for it
+    from awacs import (  # pylint: disable=import-outside-toplevel
+        aws,
+        awslambda,
+        cloudformation,
+        cloudfront,
+        events,
+        iam,
+        kms,
+        s3,
+        sts
+    )
+
     policy = aws.PolicyDocument(
         Version="2012-10-17",
         Statement=[
@@ -178,6 +188,30 @@ def get_policy(client, account):
     return policy
 
 
+@functools.lru_cache(maxsize=1)
+def get_policy_template():
+    return get_policy_structured(CLIENT_PLACEHOLDER, ACCOUNT_PLACEHOLDER).to_json()
+
+
+def get_policy(client, account):
+    """
+    The policy as JSON, without building the awacs objects for each client
+    """
+
+    # The values are escaped as awacs would have, since they are spliced into JSON strings. The client
+    # goes in last, so that it is never itself searched for a placeholder.
+    return get_policy_template().replace(
+        ACCOUNT_PLACEHOLDER, json.dumps(str(account))[1:-1]).replace(
+        CLIENT_PLACEHOLDER, json.dumps(client)[1:-1])
+
+
+@functools.lru_cache(maxsize=1)
+def get_iam_client():
+    # Only imported when needed, as only create_policy talks to AWS
+    import boto3  # pylint: disable=import-outside-toplevel
+    return boto3.client('iam')
+
+
 @cli.command()
 @click.argument('client', type=str)
 @click.argument('account', type=int)
@@ -186,7 +220,7 @@ def show_policy(client, account):
     Display the CI policy that would be created
     """
 
-    print(get_policy(client, account).to_json())
+    print(get_policy(client, account))
 
 
 @cli.command()
@@ -198,11 +232,9 @@ def create_policy(name, client, account):
     Create the CI policy in AWS
     """
 
-    policy = get_policy(client, account)
-    iam = boto3.client('iam')
-    iam.create_policy(
+    get_iam_client().create_policy(
         PolicyName=name,
-        PolicyDocument=policy.to_json(),
+        PolicyDocument=get_policy(client, account),
     )
 
 